@@ -4,28 +4,29 @@ import json
 from datetime import datetime
 import redis
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import List
+from typing import Set
 
 # Redis connection
 redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+        # Serialize once and share the frame; same encoding as send_json
+        payload = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        await asyncio.gather(
+            *(connection.send_text(payload) for connection in list(self.active_connections)),
+            return_exceptions=True
+        )
 
 manager = ConnectionManager()
 
@@ -1,13 +1,13 @@
 import asyncio
 import json
-from typing import List, Dict
+from typing import Dict, Set
 from fastapi import WebSocket
 import redis.asyncio as redis
 from datetime import datetime
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
         self.redis_client = None
         
     async def init_redis(self):
@@ -25,12 +25,11 @@ class ConnectionManager:
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
         print(f"📡 WebSocket connected. Total: {len(self.active_connections)}")
         
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
         print(f"📡 WebSocket disconnected. Total: {len(self.active_connections)}")
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
@@ -41,17 +40,19 @@ class ConnectionManager:
 
     async def broadcast(self, message: dict):
         """Broadcast message to all connected clients"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting: {e}")
-                disconnected.append(connection)
+        # Serialize once and share the frame; same encoding as send_json
+        payload = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        connections = list(self.active_connections)
+        results = await asyncio.gather(
+            *(connection.send_text(payload) for connection in connections),
+            return_exceptions=True
+        )
         
         # Clean up disconnected
-        for conn in disconnected:
-            self.disconnect(conn)
+        for conn, result in zip(connections, results):
+            if isinstance(result, Exception):
+                print(f"Error broadcasting: {result}")
+                self.disconnect(conn)
     
     async def get_cached(self, key: str) -> Dict:
         """Get cached data from Redis"""
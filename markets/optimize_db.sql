@@ -1,17 +1,20 @@
 -- ============================================
 -- STEP 1: Add Composite Indexes
 -- ============================================
+-- Plain CREATE INDEX: stock_prices is range-partitioned by month and
+-- partitioned tables don't support CONCURRENTLY; the index cascades to
+-- every partition.
 -- For sentiment query (date + symbol lookups)
-CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stock_prices_date_symbol 
+CREATE INDEX IF NOT EXISTS idx_stock_prices_date_symbol 
 ON stock_prices(date DESC, symbol);
 
 -- For asset_type filtering
-CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stock_prices_asset_date 
+CREATE INDEX IF NOT EXISTS idx_stock_prices_asset_date 
 ON stock_prices(asset_type, date DESC) 
 WHERE close IS NOT NULL;
 
 -- For latest price lookups
-CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stock_prices_symbol_date_desc 
+CREATE INDEX IF NOT EXISTS idx_stock_prices_symbol_date_desc 
 ON stock_prices(symbol, date DESC) 
 WHERE close IS NOT NULL;
 
@@ -69,10 +72,22 @@ CREATE TABLE IF NOT EXISTS stock_prices_archive (
 -- ============================================
 -- STEP 4: Set Up Auto-Vacuum
 -- ============================================
-ALTER TABLE stock_prices SET (
-    autovacuum_vacuum_scale_factor = 0.05,
-    autovacuum_analyze_scale_factor = 0.02
-);
+-- Storage parameters only apply to leaf partitions, not the partitioned
+-- parent; re-run after create_stock_price_partitions adds new months.
+DO $$
+DECLARE
+    part REGCLASS;
+BEGIN
+    FOR part IN
+        SELECT relid FROM pg_partition_tree('stock_prices') WHERE isleaf
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE %s SET (autovacuum_vacuum_scale_factor = 0.05, autovacuum_analyze_scale_factor = 0.02)',
+            part
+        );
+    END LOOP;
+END;
+$$;
 
 -- ============================================
 -- STEP 5: Create Refresh Function
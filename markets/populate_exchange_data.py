@@ -2,10 +2,13 @@
 """
 Populate stock_prices for all exchanges using yfinance
 """
-import psycopg2
-import yfinance as yf
+import argparse
+import yf_cache
+from price_store import connect, store_prices, ON_CONFLICT_IGNORE
 from datetime import datetime, timedelta
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Database connection - use Docker hostname
 DB_CONFIG = {
@@ -16,97 +19,170 @@ DB_CONFIG = {
     'password': 'openbb_pass'
 }
 
-def get_symbols_by_exchange():
+# Downloads run on a thread pool; the limiter spaces request starts across
+# all workers in place of the old fixed sleep between tickers.
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 4
+
+class RateLimiter:
+    """Allow at most `rate` calls per second across threads"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
+def fetch_history(symbol):
+    """Download a year of daily history for one symbol (runs on a worker thread)"""
+    rate_limiter.wait()
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=365)
+    return yf_cache.history(symbol, start_date, end_date)
+
+def get_symbols_by_exchange(conn, limit=100):
     """Get all symbols grouped by exchange"""
-    conn = psycopg2.connect(**DB_CONFIG)
     cur = conn.cursor()
     
+    # Filtering on the joined exchange code already excludes JSE (.JO)
+    # listings. Capped at 100 symbols per run by default, as before.
     cur.execute("""
         SELECT s.id, s.symbol, s.exchange_id, e.code as exchange_code
         FROM symbols s
         JOIN exchanges e ON s.exchange_id = e.id
-        WHERE s.symbol NOT LIKE '%.JO'
-        AND e.code IN ('NYSE', 'NASDAQ', 'AMEX', 'LSE', 'TSE', 'FWB')
+        WHERE e.code IN ('NYSE', 'NASDAQ', 'AMEX', 'LSE', 'TSE', 'FWB')
         ORDER BY e.code, s.symbol
-        LIMIT 100;
-    """)
+        LIMIT %s;
+    """, (limit,))
     
     results = cur.fetchall()
     cur.close()
-    conn.close()
-    
+
     return results
 
-def fetch_and_store_prices(symbol_id, symbol, exchange_code):
-    """Fetch historical prices and store in database"""
+def drop_secondary_indexes(conn):
+    """Drop non-unique stock_prices indexes before a bulk load, returning their definitions"""
+    cur = conn.cursor()
+
+    # Unique/primary indexes stay live: ON CONFLICT (symbol, date) needs them
+    cur.execute("""
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = 'stock_prices'::regclass
+        AND NOT x.indisunique
+        AND NOT x.indisprimary;
+    """)
+    indexes = cur.fetchall()
+
+    for name, _ in indexes:
+        cur.execute(f'DROP INDEX IF EXISTS "{name}";')
+        print(f"  🗑️  Dropped {name}")
+
+    conn.commit()
+    cur.close()
+
+    return indexes
+
+def rebuild_secondary_indexes(conn, indexes):
+    """Recreate the indexes dropped for a bulk load and refresh planner stats"""
+    conn.rollback()
+    cur = conn.cursor()
+
+    # One sorted build per index instead of per-row maintenance during the load.
+    # Plain CREATE INDEX: CONCURRENTLY is slower and unsupported on partitioned tables.
+    cur.execute("SET maintenance_work_mem = '512MB';")
+    for name, definition in indexes:
+        # On a partitioned stock_prices, pg_get_indexdef says "ON ONLY", which
+        # would build an invalid parent index with nothing on the partitions
+        cur.execute(definition.replace(" ON ONLY ", " ON ", 1))
+        print(f"  🔨 Rebuilt {name}")
+    cur.execute("ANALYZE stock_prices;")
+
+    conn.commit()
+
+    cur.execute("""
+        SELECT i.relname
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = 'stock_prices'::regclass
+        AND NOT x.indisvalid
+        AND i.relname = ANY(%s);
+    """, ([name for name, _ in indexes],))
+    for (name,) in cur.fetchall():
+        print(f"  ❌ {name} is invalid after rebuild; recreate it by hand")
+    conn.commit()
+    cur.close()
+
+def fetch_and_store_prices(conn, symbol_id, symbol, exchange_code, download):
+    """Wait for a symbol's historical prices and store them in database"""
     try:
-        ticker = yf.Ticker(symbol)
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
-        
-        hist = ticker.history(start=start_date, end=end_date)
+        hist = download.result()
         
         if hist.empty:
             print(f"  ⚠️  No data for {symbol}")
             return 0
         
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        inserted = 0
-        for date, row in hist.iterrows():
-            try:
-                cur.execute("""
-                    INSERT INTO stock_prices (symbol, date, open, high, low, close, volume, asset_type, symbol_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (symbol, date) DO NOTHING
-                """, (
-                    symbol,
-                    date,
-                    float(row['Open']),
-                    float(row['High']),
-                    float(row['Low']),
-                    float(row['Close']),
-                    int(row['Volume']),
-                    'EQUITY',
-                    symbol_id
-                ))
-                inserted += 1
-            except Exception as e:
-                print(f"    Error inserting {symbol} {date}: {e}")
-                continue
-        
+        with conn.cursor() as cur:
+            inserted = store_prices(cur, symbol, hist, 'EQUITY', symbol_id, ON_CONFLICT_IGNORE)
         conn.commit()
-        cur.close()
-        conn.close()
         
         print(f"  ✅ {symbol}: {inserted} records")
         return inserted
         
     except Exception as e:
+        conn.rollback()
         print(f"  ❌ {symbol}: {e}")
         return 0
 
 def main():
+    parser = argparse.ArgumentParser(description="Populate stock_prices for all exchanges")
+    parser.add_argument("--limit", type=int, default=100, help="Only process the first N symbols (default: 100)")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Drop secondary stock_prices indexes during the load and rebuild them after")
+    args = parser.parse_args()
+
     print("🚀 Starting data population...")
     print("=" * 60)
-    
-    symbols = get_symbols_by_exchange()
+
+    conn = connect(DB_CONFIG)
+    symbols = get_symbols_by_exchange(conn, args.limit)
     print(f"\n📊 Found {len(symbols)} symbols to process\n")
-    
+
+    dropped_indexes = []
+    if args.bulk:
+        print("📦 Bulk mode: dropping secondary indexes")
+        dropped_indexes = drop_secondary_indexes(conn)
+
     total_inserted = 0
     current_exchange = None
-    
-    for symbol_id, symbol, exchange_id, exchange_code in symbols:
-        if current_exchange != exchange_code:
-            current_exchange = exchange_code
-            print(f"\n📍 {exchange_code}")
-            print("-" * 40)
-        
-        inserted = fetch_and_store_prices(symbol_id, symbol, exchange_code)
-        total_inserted += inserted
-        
-        time.sleep(0.5)
+
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            # Downloads overlap on the pool; this thread is the only DB writer
+            downloads = [pool.submit(fetch_history, row[1]) for row in symbols]
+
+            for (symbol_id, symbol, exchange_id, exchange_code), download in zip(symbols, downloads):
+                if current_exchange != exchange_code:
+                    current_exchange = exchange_code
+                    print(f"\n📍 {exchange_code}")
+                    print("-" * 40)
+
+                inserted = fetch_and_store_prices(conn, symbol_id, symbol, exchange_code, download)
+                total_inserted += inserted
+    finally:
+        # Rebuild even if the load is interrupted, so the API never runs without them
+        if dropped_indexes:
+            print("\n📦 Bulk mode: rebuilding secondary indexes")
+            rebuild_secondary_indexes(conn, dropped_indexes)
+        conn.close()
     
     print(f"\n" + "=" * 60)
     print(f"✅ Complete! Inserted {total_inserted} total records")
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 import psycopg2
-import yfinance as yf
-from datetime import datetime, timedelta
-import time
+from psycopg2.extras import execute_values
+import yf_cache
+from price_store import connect, store_prices, ON_CONFLICT_UPDATE
 
 DB_CONFIG = {
     'host': 'markets_db',
@@ -35,7 +35,7 @@ GUARANTEED_TICKERS = {
 }
 
 def clean_and_populate():
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = connect(DB_CONFIG)
     cur = conn.cursor()
     
     print("🧹 Cleaning up and populating with GUARANTEED tickers...")
@@ -56,81 +56,70 @@ def clean_and_populate():
             continue
         exchange_id = result[0]
         
-        # Mark all existing symbols as inactive
-        cur.execute("""
-            UPDATE symbols SET is_active = false 
-            WHERE exchange_id = %s
-        """, (exchange_id,))
-        conn.commit()
+        try:
+            # Mark all existing symbols as inactive
+            cur.execute("""
+                UPDATE symbols SET is_active = false 
+                WHERE exchange_id = %s
+            """, (exchange_id,))
+            
+            # Add/activate all guaranteed tickers in one statement
+            result = execute_values(cur, """
+                INSERT INTO symbols (symbol, name, exchange_id, is_active)
+                VALUES %s
+                ON CONFLICT (symbol, exchange_id) DO UPDATE 
+                SET is_active = true
+                RETURNING id, symbol
+            """, [(ticker, ticker, exchange_id, True) for ticker in tickers], fetch=True)
+            conn.commit()
+        except Exception as e:
+            print(f"  ❌ Symbol upsert failed: {str(e)[:40]}")
+            conn.rollback()
+            continue
+        
+        symbol_ids = {symbol: symbol_id for symbol_id, symbol in result}
+        
+        # One batched download per exchange instead of a request per ticker
+        try:
+            history = yf_cache.download_recent(tickers, 365)
+        except Exception as e:
+            print(f"  ❌ Download failed: {str(e)[:40]}")
+            history = {}
         
-        # Add/activate guaranteed tickers
         added = 0
         for ticker in tickers:
+            symbol_id = symbol_ids.get(ticker)
+            if not symbol_id:
+                print(f"  ⚠️  {ticker:<12} Failed to insert")
+                continue
+            
             try:
-                # Insert or update symbol (without category column)
-                cur.execute("""
-                    INSERT INTO symbols (symbol, name, exchange_id, is_active)
-                    VALUES (%s, %s, %s, true)
-                    ON CONFLICT (symbol, exchange_id) DO UPDATE 
-                    SET is_active = true
-                    RETURNING id
-                """, (ticker, ticker, exchange_id))
+                hist = history.get(ticker)
                 
-                result = cur.fetchone()
-                if not result:
-                    print(f"  ⚠️  {ticker:<12} Failed to insert")
-                    conn.rollback()
-                    continue
+                if hist is not None and not hist.empty:
+                    asset_type = 'CRYPTO' if '-USD' in ticker else 'EQUITY'
+                    # A failed ticker only rolls back to its savepoint, so the
+                    # exchange's other tickers still go out in one commit
+                    cur.execute("SAVEPOINT ticker_sp")
+                    try:
+                        inserted = store_prices(cur, ticker, hist, asset_type, symbol_id, ON_CONFLICT_UPDATE)
+                    except Exception:
+                        cur.execute("ROLLBACK TO SAVEPOINT ticker_sp")
+                        raise
+                    cur.execute("RELEASE SAVEPOINT ticker_sp")
                     
-                symbol_id = result[0]
-                conn.commit()
-                
-                # Fetch price data
-                try:
-                    yf_ticker = yf.Ticker(ticker)
-                    end = datetime.now()
-                    start = end - timedelta(days=365)
-                    hist = yf_ticker.history(start=start, end=end)
-                    
-                    if not hist.empty:
-                        inserted = 0
-                        for date, row in hist.iterrows():
-                            try:
-                                cur.execute("""
-                                    INSERT INTO stock_prices (symbol, date, open, high, low, close, volume, asset_type, symbol_id)
-                                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                                    ON CONFLICT (symbol, date) DO UPDATE SET
-                                        open = EXCLUDED.open, high = EXCLUDED.high,
-                                        low = EXCLUDED.low, close = EXCLUDED.close, volume = EXCLUDED.volume
-                                """, (ticker, date, float(row['Open']), float(row['High']),
-                                      float(row['Low']), float(row['Close']), int(row['Volume']),
-                                      'CRYPTO' if '-USD' in ticker else 'EQUITY', symbol_id))
-                                inserted += 1
-                            except Exception as e:
-                                conn.rollback()
-                                conn.commit()  # Start fresh transaction
-                                continue
-                        
-                        conn.commit()
-                        if inserted > 0:
-                            print(f"  ✅ {ticker:<12} {inserted} records")
-                            added += 1
-                            total_prices += inserted
-                        else:
-                            print(f"  ⚠️  {ticker:<12} No records inserted")
+                    if inserted > 0:
+                        print(f"  ✅ {ticker:<12} {inserted} records")
+                        added += 1
+                        total_prices += inserted
                     else:
-                        print(f"  ⚠️  {ticker:<12} No data from yfinance")
-                except Exception as e:
-                    print(f"  ❌ {ticker:<12} {str(e)[:40]}")
-                    conn.rollback()
-                
-                time.sleep(0.3)
-                
+                        print(f"  ⚠️  {ticker:<12} No records inserted")
+                else:
+                    print(f"  ⚠️  {ticker:<12} No data from yfinance")
             except Exception as e:
                 print(f"  ❌ {ticker:<12} {str(e)[:40]}")
-                conn.rollback()
-                continue
         
+        conn.commit()
         total_added += added
         print(f"\n  ✓ {exchange_code}: {added}/{len(tickers)} successful")
     
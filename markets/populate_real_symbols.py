@@ -2,10 +2,8 @@
 """
 Populate exchanges with REAL ticker symbols and their price data
 """
-import psycopg2
-import yfinance as yf
-from datetime import datetime, timedelta
-import time
+import yf_cache
+from price_store import connect, store_prices, ON_CONFLICT_UPDATE
 
 DB_CONFIG = {
     'host': 'markets_db',
@@ -24,98 +22,49 @@ REAL_TICKERS = {
     'JSE': ['AGL.JO', 'BTI.JO', 'SHP.JO', 'NPN.JO', 'CFR.JO', 'ANG.JO', 'ABG.JO', 'SBK.JO', 'FSR.JO', 'MTN.JO'],
 }
 
-def get_exchange_id(exchange_code):
-    """Get exchange ID from code"""
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM exchanges WHERE code = %s", (exchange_code,))
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    return result[0] if result else None
+def get_exchange_ids(conn):
+    """Map every exchange code to its ID in one query"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT code, id FROM exchanges")
+        return dict(cur.fetchall())
 
-def add_or_update_symbol(exchange_code, ticker):
+def add_or_update_symbol(conn, exchange_ids, exchange_code, ticker):
     """Add or update symbol in database"""
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    
-    exchange_id = get_exchange_id(exchange_code)
+    exchange_id = exchange_ids.get(exchange_code)
     if not exchange_id:
         print(f"  ⚠️  Exchange {exchange_code} not found")
         return None
     
-    # Check if symbol exists
-    cur.execute("SELECT id FROM symbols WHERE symbol = %s", (ticker,))
-    result = cur.fetchone()
-    
-    if result:
-        symbol_id = result[0]
-    else:
-        # Insert new symbol
+    # Single upsert; the no-op DO UPDATE makes RETURNING yield existing rows too
+    with conn.cursor() as cur:
         cur.execute("""
             INSERT INTO symbols (symbol, name, exchange_id, category)
             VALUES (%s, %s, %s, %s)
+            ON CONFLICT (symbol, exchange_id) DO UPDATE
+            SET exchange_id = EXCLUDED.exchange_id
             RETURNING id
         """, (ticker, ticker, exchange_id, 'stocks'))
         symbol_id = cur.fetchone()[0]
-        conn.commit()
+    conn.commit()
     
-    cur.close()
-    conn.close()
     return symbol_id
 
-def fetch_and_store_prices(symbol_id, ticker):
-    """Fetch and store price data"""
+def fetch_and_store_prices(conn, symbol_id, ticker, hist):
+    """Store a ticker's downloaded price data"""
     try:
-        yf_ticker = yf.Ticker(ticker)
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
-        
-        hist = yf_ticker.history(start=start_date, end=end_date)
-        
-        if hist.empty:
+        if hist is None or hist.empty:
             print(f"  ⚠️  No data for {ticker}")
             return 0
         
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        inserted = 0
-        for date, row in hist.iterrows():
-            try:
-                cur.execute("""
-                    INSERT INTO stock_prices (symbol, date, open, high, low, close, volume, asset_type, symbol_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (symbol, date) DO UPDATE SET
-                        open = EXCLUDED.open,
-                        high = EXCLUDED.high,
-                        low = EXCLUDED.low,
-                        close = EXCLUDED.close,
-                        volume = EXCLUDED.volume
-                """, (
-                    ticker,
-                    date,
-                    float(row['Open']),
-                    float(row['High']),
-                    float(row['Low']),
-                    float(row['Close']),
-                    int(row['Volume']),
-                    'EQUITY',
-                    symbol_id
-                ))
-                inserted += 1
-            except Exception as e:
-                print(f"    Error: {e}")
-                continue
-        
+        with conn.cursor() as cur:
+            inserted = store_prices(cur, ticker, hist, 'EQUITY', symbol_id, ON_CONFLICT_UPDATE)
         conn.commit()
-        cur.close()
-        conn.close()
         
         print(f"  ✅ {ticker}: {inserted} records")
         return inserted
         
     except Exception as e:
+        conn.rollback()
         print(f"  ❌ {ticker}: {e}")
         return 0
 
@@ -124,17 +73,28 @@ def main():
     print("=" * 60)
     
     total_inserted = 0
+    conn = connect(DB_CONFIG)
+    exchange_ids = get_exchange_ids(conn)
+    
+    # One batched download for every ticker; yfinance fetches them concurrently
+    all_tickers = [ticker for tickers in REAL_TICKERS.values() for ticker in tickers]
+    try:
+        history = yf_cache.download_recent(all_tickers, 365)
+    except Exception as e:
+        print(f"❌ Download failed: {e}")
+        history = {}
     
     for exchange_code, tickers in REAL_TICKERS.items():
         print(f"\n📍 {exchange_code}")
         print("-" * 40)
         
         for ticker in tickers:
-            symbol_id = add_or_update_symbol(exchange_code, ticker)
+            symbol_id = add_or_update_symbol(conn, exchange_ids, exchange_code, ticker)
             if symbol_id:
-                inserted = fetch_and_store_prices(symbol_id, ticker)
+                inserted = fetch_and_store_prices(conn, symbol_id, ticker, history.get(ticker))
                 total_inserted += inserted
-                time.sleep(1)  # Rate limiting
+    
+    conn.close()
     
     print(f"\n" + "=" * 60)
     print(f"✅ Complete! Inserted {total_inserted} total records")
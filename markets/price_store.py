@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Shared stock_prices writer for the populate scripts and the market updater
+"""
+import psycopg2
+from psycopg2.extras import execute_values
+
+PRICE_COLUMNS = "symbol, date, open, high, low, close, volume, asset_type, symbol_id"
+
+# Pass one of these as on_conflict: keep existing bars, or refresh them
+ON_CONFLICT_IGNORE = """
+    ON CONFLICT (symbol, date) DO NOTHING
+"""
+ON_CONFLICT_UPDATE = """
+    ON CONFLICT (symbol, date) DO UPDATE SET
+        open = EXCLUDED.open,
+        high = EXCLUDED.high,
+        low = EXCLUDED.low,
+        close = EXCLUDED.close,
+        volume = EXCLUDED.volume
+"""
+
+def connect(db_config):
+    """Open the single connection a populate/update run writes prices through"""
+    # A crash only loses prices the next run reloads, so the run's frequent
+    # commits needn't wait for the WAL flush
+    return psycopg2.connect(**db_config, options='-c synchronous_commit=off')
+
+# Rows per INSERT statement; a year of daily bars goes in one round-trip.
+# execute_values is the only loader: no caller sends more than about 366 bars
+# per ticker, so a COPY staging table would only add a round-trip.
+EXECUTE_VALUES_PAGE_SIZE = 1000
+
+def price_rows(symbol, hist, asset_type, symbol_id):
+    """Build stock_prices row tuples from a yfinance history frame"""
+    # Batched downloads only drop all-NaN padding rows. A bar without a volume
+    # can't be stored (the int64 cast would turn NaN into garbage), so skip it.
+    hist = hist[hist['Volume'].notna()]
+
+    # Pull whole columns out as numpy arrays instead of building a Series per row
+    prices = hist[['Open', 'High', 'Low', 'Close']].to_numpy(dtype='float64').tolist()
+    volumes = hist['Volume'].to_numpy(dtype='int64').tolist()
+    dates = hist.index.to_pydatetime()
+    return [
+        (symbol, date, open_, high, low, close, volume, asset_type, symbol_id)
+        for date, (open_, high, low, close), volume in zip(dates, prices, volumes)
+    ]
+
+def store_prices(cur, symbol, hist, asset_type, symbol_id, on_conflict):
+    """Upsert a yfinance history frame, one round-trip per page of rows"""
+    rows = price_rows(symbol, hist, asset_type, symbol_id)
+    if not rows:
+        return 0
+    execute_values(
+        cur,
+        f"INSERT INTO stock_prices ({PRICE_COLUMNS}) VALUES %s {on_conflict}",
+        rows,
+        page_size=EXECUTE_VALUES_PAGE_SIZE
+    )
+    return len(rows)
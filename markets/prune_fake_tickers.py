@@ -41,14 +41,19 @@ def main():
     print("\n🔍 Identifying fake placeholder tickers...")
     print("-"*70)
     
+    # Evaluate the regexes in a single pass over symbols; the count, sample
+    # and both DELETEs below then work off this table by key
     cur.execute("""
-        SELECT COUNT(*) 
+        CREATE TEMP TABLE fake_syms ON COMMIT DROP AS
+        SELECT id, symbol, exchange_id
         FROM symbols 
-        WHERE symbol ~ '^[A-Z]+[0-9]{4}$'  -- Matches: AMEX0000, JSE0001, etc.
-        OR symbol ~ '^[A-Z]+[0-9]{4}\.(L|JO|TO|DE|PA|AX|HK|T)$'  -- With suffixes
+        -- Matches AMEX0000, JSE0001, etc., optionally with an exchange suffix.
+        -- One anchored pattern, so each row goes through the regex engine once.
+        WHERE symbol ~ '^[A-Z]+[0-9]{4}(\.(L|JO|TO|DE|PA|AX|HK|T))?$'
     """)
-    
-    fake_count = cur.fetchone()[0]
+    fake_count = cur.rowcount
+    cur.execute("CREATE INDEX ON fake_syms(symbol)")
+    cur.execute("ANALYZE fake_syms")
     print(f"  Found {fake_count} fake placeholder tickers")
     
     if fake_count == 0:
@@ -60,11 +65,9 @@ def main():
     # Show examples
     print("\n📋 Examples of fake tickers to be deleted:")
     cur.execute("""
-        SELECT symbol, e.code
-        FROM symbols s
-        JOIN exchanges e ON s.exchange_id = e.id
-        WHERE symbol ~ '^[A-Z]+[0-9]{4}$'
-        OR symbol ~ '^[A-Z]+[0-9]{4}\.(L|JO|TO|DE|PA|AX|HK|T)$'
+        SELECT fs.symbol, e.code
+        FROM fake_syms fs
+        JOIN exchanges e ON fs.exchange_id = e.id
         ORDER BY random()
         LIMIT 10
     """)
@@ -87,21 +90,18 @@ def main():
     try:
         # First delete associated price data
         cur.execute("""
-            DELETE FROM stock_prices
-            WHERE symbol IN (
-                SELECT symbol FROM symbols
-                WHERE symbol ~ '^[A-Z]+[0-9]{4}$'
-                OR symbol ~ '^[A-Z]+[0-9]{4}\.(L|JO|TO|DE|PA|AX|HK|T)$'
-            )
+            DELETE FROM stock_prices sp
+            USING (SELECT DISTINCT symbol FROM fake_syms) fs
+            WHERE sp.symbol = fs.symbol
         """)
         price_deleted = cur.rowcount
         print(f"  ✓ Deleted {price_deleted} price records")
         
         # Then delete the symbols
         cur.execute("""
-            DELETE FROM symbols
-            WHERE symbol ~ '^[A-Z]+[0-9]{4}$'
-            OR symbol ~ '^[A-Z]+[0-9]{4}\.(L|JO|TO|DE|PA|AX|HK|T)$'
+            DELETE FROM symbols s
+            USING fake_syms fs
+            WHERE s.id = fs.id
         """)
         symbols_deleted = cur.rowcount
         print(f"  ✓ Deleted {symbols_deleted} fake symbols")
@@ -3,10 +3,11 @@
 Smart market data updater - checks DB state and updates incrementally
 """
 import psycopg2
-import yfinance as yf
+from psycopg2.extras import execute_values
 import pandas as pd
+import yf_cache
+from price_store import connect, store_prices, ON_CONFLICT_UPDATE
 from datetime import datetime, timedelta
-import time
 
 DB_CONFIG = {
     'host': 'markets_db',
@@ -16,91 +17,80 @@ DB_CONFIG = {
     'password': 'openbb_pass'
 }
 
-def get_db_status():
+# Reruns within the hour reuse the last download instead of re-querying
+# Yahoo; kept short so today's bar still refreshes on later runs.
+DOWNLOAD_CACHE_MAX_AGE = 3600
+
+def get_db_status(conn):
     """Check current database state"""
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT 
-            e.code,
-            e.id,
-            COUNT(DISTINCT s.id) as total_symbols,
-            COUNT(DISTINCT CASE WHEN sp.id IS NOT NULL THEN s.id END) as symbols_with_prices,
-            MAX(sp.date) as latest_price_date,
-            COUNT(sp.id) as total_price_records
-        FROM exchanges e
-        LEFT JOIN symbols s ON s.exchange_id = e.id AND s.is_active = true
-        LEFT JOIN stock_prices sp ON sp.symbol = s.symbol
-        WHERE e.is_active = true
-        GROUP BY e.code, e.id
-        ORDER BY e.code
-    """)
+    # "with conn" ends the read transaction so the shared connection isn't left idle in it
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT 
+                e.code,
+                e.id,
+                COUNT(DISTINCT s.id) as total_symbols,
+                COUNT(DISTINCT CASE WHEN sp.id IS NOT NULL THEN s.id END) as symbols_with_prices,
+                MAX(sp.date) as latest_price_date,
+                COUNT(sp.id) as total_price_records,
+                sym.symbols
+            FROM exchanges e
+            LEFT JOIN symbols s ON s.exchange_id = e.id AND s.is_active = true
+            LEFT JOIN stock_prices sp ON sp.symbol = s.symbol
+            -- Real tickers for expand_ticker_lists, read from symbols alone
+            -- rather than aggregated over the symbols x stock_prices join
+            LEFT JOIN LATERAL (
+                SELECT array_agg(symbol) as symbols
+                FROM symbols
+                WHERE exchange_id = e.id
+                AND is_active = true
+                AND symbol NOT LIKE '%0000%'  -- Exclude fake placeholders
+                AND symbol NOT LIKE '%0001%'
+            ) sym ON true
+            WHERE e.is_active = true
+            GROUP BY e.code, e.id, sym.symbols
+            ORDER BY e.code
+        """)
+        rows = cur.fetchall()
     
     status = {}
-    for row in cur.fetchall():
+    for row in rows:
         status[row[0]] = {
             'exchange_id': row[1],
             'total_symbols': row[2],
             'symbols_with_prices': row[3],
             'latest_date': row[4],
-            'total_records': row[5]
+            'total_records': row[5],
+            'symbols': row[6] or []
         }
     
-    cur.close()
-    conn.close()
     return status
 
-def get_symbols_needing_update(exchange_code, days_old=1):
+def get_symbols_needing_update(conn, exchange_code, days_old=1):
     """Get symbols that need price updates - FIXED ORDER BY"""
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    
     cutoff_date = datetime.now() - timedelta(days=days_old)
     
-    cur.execute("""
-        SELECT s.id, s.symbol, COALESCE(sp.last_update, '1970-01-01'::timestamp) as last_update
-        FROM symbols s
-        JOIN exchanges e ON s.exchange_id = e.id
-        LEFT JOIN (
-            SELECT symbol, MAX(date) as last_update
-            FROM stock_prices
-            GROUP BY symbol
-        ) sp ON sp.symbol = s.symbol
-        WHERE e.code = %s 
-        AND s.is_active = true
-        AND (sp.last_update IS NULL OR sp.last_update < %s)
-        ORDER BY last_update NULLS FIRST
-    """, (exchange_code, cutoff_date))
+    # LATERAL MAX(date) per symbol is a backward probe of the (symbol, date)
+    # unique index, instead of aggregating all of stock_prices per exchange
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT s.id, s.symbol, COALESCE(sp.last_update, '1970-01-01'::timestamp) as last_update
+            FROM symbols s
+            JOIN exchanges e ON s.exchange_id = e.id
+            LEFT JOIN LATERAL (
+                SELECT MAX(date) as last_update
+                FROM stock_prices
+                WHERE symbol = s.symbol
+            ) sp ON true
+            WHERE e.code = %s 
+            AND s.is_active = true
+            AND (sp.last_update IS NULL OR sp.last_update < %s)
+            ORDER BY last_update NULLS FIRST
+        """, (exchange_code, cutoff_date))
+        symbols = [(row[0], row[1]) for row in cur.fetchall()]
     
-    symbols = [(row[0], row[1]) for row in cur.fetchall()]
-    cur.close()
-    conn.close()
     return symbols
 
-def get_existing_tickers():
-    """Get tickers already in DB to avoid fetching them from scratch"""
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT e.code, array_agg(s.symbol) as symbols
-        FROM symbols s
-        JOIN exchanges e ON s.exchange_id = e.id
-        WHERE s.is_active = true 
-        AND s.symbol NOT LIKE '%0000%'  -- Exclude fake placeholders
-        AND s.symbol NOT LIKE '%0001%'
-        GROUP BY e.code
-    """)
-    
-    existing = {}
-    for row in cur.fetchall():
-        existing[row[0]] = row[1] if row[1] else []
-    
-    cur.close()
-    conn.close()
-    return existing
-
 def expand_ticker_lists(existing):
     """Expand existing ticker lists with known good tickers"""
     expanded = {}
@@ -158,67 +148,45 @@ def expand_ticker_lists(existing):
     
     return expanded
 
-def add_missing_symbols(exchange_code, exchange_id, ticker_list):
+def add_missing_symbols(conn, exchange_code, exchange_id, ticker_list):
     """Add symbols that don't exist yet"""
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
+    category = 'crypto' if exchange_code == 'CRYPTO' else 'stocks'
+    rows = [(ticker, ticker, exchange_id, category) for ticker in ticker_list]
     
-    added = 0
-    for ticker in ticker_list:
-        try:
-            cur.execute("""
+    # One multi-row INSERT; RETURNING only yields the rows actually inserted
+    try:
+        with conn.cursor() as cur:
+            added = execute_values(cur, """
                 INSERT INTO symbols (symbol, name, exchange_id, category, is_active)
-                VALUES (%s, %s, %s, %s, true)
+                VALUES %s
                 ON CONFLICT (symbol, exchange_id) DO NOTHING
                 RETURNING id
-            """, (ticker, ticker, exchange_id, 'crypto' if exchange_code == 'CRYPTO' else 'stocks'))
-            
-            if cur.fetchone():
-                added += 1
-        except:
-            continue
+            """, rows, template="(%s, %s, %s, %s, true)", page_size=500, fetch=True)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"  {exchange_code:<10} ❌ {e}")
+        return 0
     
-    conn.commit()
-    cur.close()
-    conn.close()
-    return added
+    return len(added)
 
-def update_price_data(symbol_id, ticker, days_back=30):
-    """Fetch and update price data"""
+def update_price_data(conn, symbol_id, ticker, hist):
+    """Store a ticker's downloaded price data"""
+    if hist is None or hist.empty:
+        return 0
+    
+    asset_type = 'CRYPTO' if '-USD' in ticker else 'EQUITY'
     try:
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days_back)
-        
-        yf_ticker = yf.Ticker(ticker)
-        hist = yf_ticker.history(start=start_date, end=end_date)
-        
-        if hist.empty:
-            return 0
-        
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        
-        inserted = 0
-        for date, row in hist.iterrows():
-            try:
-                cur.execute("""
-                    INSERT INTO stock_prices (symbol, date, open, high, low, close, volume, asset_type, symbol_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (symbol, date) DO UPDATE SET
-                        open = EXCLUDED.open, high = EXCLUDED.high,
-                        low = EXCLUDED.low, close = EXCLUDED.close, volume = EXCLUDED.volume
-                """, (ticker, date, float(row['Open']), float(row['High']),
-                      float(row['Low']), float(row['Close']), int(row['Volume']),
-                      'CRYPTO' if '-USD' in ticker else 'EQUITY', symbol_id))
-                inserted += 1
-            except:
-                continue
-        
+        with conn.cursor() as cur:
+            inserted = store_prices(cur, ticker, hist, asset_type, symbol_id, ON_CONFLICT_UPDATE)
         conn.commit()
-        cur.close()
-        conn.close()
         return inserted
-    except:
+    except psycopg2.Error as e:
+        # price_rows drops NaN-volume bars, so what's left to fail is the
+        # INSERT itself (e.g. an out-of-range value or a constraint). The
+        # connection is shared, so don't leave it in an aborted transaction.
+        conn.rollback()
+        print(f"    ❌ {ticker}: {e}")
         return 0
 
 def main():
@@ -227,10 +195,12 @@ def main():
     print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("="*70)
     
+    conn = connect(DB_CONFIG)
+    
     # 1. Check current DB status
     print("\n📊 Current Database Status:")
     print("-"*70)
-    status = get_db_status()
+    status = get_db_status(conn)
     
     for exchange, info in sorted(status.items()):
         latest = info['latest_date'].strftime('%Y-%m-%d') if info['latest_date'] else 'Never'
@@ -240,7 +210,7 @@ def main():
     # 2. Get existing tickers and expand
     print("\n🔍 Analyzing existing tickers...")
     print("-"*70)
-    existing = get_existing_tickers()
+    existing = {exchange: info['symbols'] for exchange, info in status.items()}
     ticker_lists = expand_ticker_lists(existing)
     
     for exchange, tickers in ticker_lists.items():
@@ -255,7 +225,7 @@ def main():
             continue
         
         exchange_id = status[exchange]['exchange_id']
-        added = add_missing_symbols(exchange, exchange_id, tickers)
+        added = add_missing_symbols(conn, exchange, exchange_id, tickers)
         
         if added > 0:
             print(f"  {exchange:<10} +{added} new symbols")
@@ -271,7 +241,7 @@ def main():
         if exchange not in status:
             continue
         
-        symbols = get_symbols_needing_update(exchange, days_old=1)
+        symbols = get_symbols_needing_update(conn, exchange, days_old=1)
         
         if not symbols:
             print(f"  {exchange:<10} All up-to-date ✓")
@@ -279,16 +249,27 @@ def main():
         
         print(f"  {exchange:<10} Updating {len(symbols)} symbols...")
         
+        batch = symbols[:50]  # Limit to 50 per exchange per run
+        # One batched download per exchange; yfinance fetches the tickers concurrently
+        try:
+            history = yf_cache.download_recent(
+                [ticker for _, ticker in batch], 30, max_age=DOWNLOAD_CACHE_MAX_AGE
+            )
+        except Exception as e:
+            print(f"  {exchange:<10} ❌ Download failed: {e}")
+            history = {}
+        
         updated = 0
-        for symbol_id, ticker in symbols[:50]:  # Limit to 50 per exchange per run
-            records = update_price_data(symbol_id, ticker, days_back=30)
+        for symbol_id, ticker in batch:
+            records = update_price_data(conn, symbol_id, ticker, history.get(ticker))
             if records > 0:
                 updated += 1
                 total_updated += 1
-            time.sleep(0.3)
         
         print(f"  {exchange:<10} Updated {updated} symbols ✓")
     
+    conn.close()
+    
     # 5. Final status
     print("\n" + "="*70)
     print(f"✅ Update complete! Updated {total_updated} symbols with price data")
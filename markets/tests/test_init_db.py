@@ -0,0 +1,77 @@
+"""Run the stock_prices partitioning DDL against a real PostgreSQL server"""
+
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import init_db
+
+pgserver = pytest.importorskip("pgserver")
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv = pgserver.get_server(tempfile.mkdtemp(), cleanup_mode="stop")
+    yield srv
+    srv.cleanup()
+
+
+@pytest.fixture
+def engine(server):
+    eng = create_engine(server.get_uri().replace("postgresql://", "postgresql+psycopg2://"))
+    with eng.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public;"))
+    yield eng
+    eng.dispose()
+
+
+def _partitions(conn):
+    return set(conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'stock_prices'::regclass
+    """)).scalars())
+
+
+def test_init_schema_creates_tables_and_partitions(engine):
+    init_db.init_schema(engine)
+
+    with engine.connect() as conn:
+        tables = set(conn.execute(text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = 'public'"
+        )).scalars())
+        assert {"stock_prices", "crypto_prices", "news_articles", "news_article_symbols"} <= tables
+
+        partitions = _partitions(conn)
+        month = conn.execute(text("SELECT to_char(CURRENT_DATE, 'YYYYMM')")).scalar()
+        assert "stock_prices_default" in partitions
+        assert f"stock_prices_{month}" in partitions
+        # 24 months back through 3 ahead, plus the default partition
+        assert len(partitions) == 29
+
+
+def test_partition_job_moves_rows_out_of_default_partition(engine):
+    init_db.init_schema(engine)
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO stock_prices (symbol, date, close, volume)
+            VALUES ('AAPL', date_trunc('month', CURRENT_DATE + INTERVAL '6 months') + INTERVAL '2 days', 1, 1)
+        """))
+        assert conn.execute(text("SELECT count(*) FROM stock_prices_default")).scalar() == 1
+
+        # The monthly job ran late: the row's month is only created now
+        conn.execute(text("""
+            SELECT create_stock_price_partitions(
+                CURRENT_DATE, (CURRENT_DATE + INTERVAL '6 months')::date
+            )
+        """))
+
+        assert conn.execute(text("SELECT count(*) FROM stock_prices_default")).scalar() == 0
+        assert conn.execute(text("SELECT count(*) FROM stock_prices WHERE symbol = 'AAPL'")).scalar() == 1
+        month = conn.execute(text(
+            "SELECT to_char(CURRENT_DATE + INTERVAL '6 months', 'YYYYMM')"
+        )).scalar()
+        assert f"stock_prices_{month}" in _partitions(conn)
@@ -0,0 +1,46 @@
+"""Tests for the shared stock_prices row builder"""
+
+import math
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from price_store import price_rows
+
+
+def _history(volumes):
+    index = pd.DatetimeIndex(
+        [datetime(2024, 1, day, 5, tzinfo=timezone.utc) for day in range(2, 2 + len(volumes))],
+        name="Date",
+    )
+    return pd.DataFrame(
+        {
+            "Open": [10.0] * len(volumes),
+            "High": [11.0] * len(volumes),
+            "Low": [9.0] * len(volumes),
+            "Close": [10.5] * len(volumes),
+            "Volume": volumes,
+        },
+        index=index,
+    )
+
+
+def test_price_rows_builds_one_tuple_per_bar():
+    rows = price_rows("AAPL", _history([100.0, 200.0]), "EQUITY", 7)
+
+    assert rows == [
+        ("AAPL", datetime(2024, 1, 2, 5, tzinfo=timezone.utc), 10.0, 11.0, 9.0, 10.5, 100, "EQUITY", 7),
+        ("AAPL", datetime(2024, 1, 3, 5, tzinfo=timezone.utc), 10.0, 11.0, 9.0, 10.5, 200, "EQUITY", 7),
+    ]
+    assert all(type(row[6]) is int for row in rows)
+
+
+def test_price_rows_skips_bars_with_nan_volume():
+    rows = price_rows("AAPL", _history([100.0, math.nan, 300.0]), "EQUITY", 7)
+
+    assert [row[1].day for row in rows] == [2, 4]
+    assert [row[6] for row in rows] == [100, 300]
+
+
+def test_price_rows_all_nan_volume_yields_no_rows():
+    assert price_rows("AAPL", _history([math.nan, math.nan]), "EQUITY", 7) == []
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+On-disk cache for yfinance history downloads used by the populate scripts
+"""
+import os
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+import yfinance as yf
+
+CACHE_DIR = os.getenv("YF_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".yf_cache"))
+CACHE_TTL_SECONDS = float(os.getenv("YF_CACHE_TTL_HOURS", "6")) * 3600
+
+def generate_cache_key(kind, *args):
+    """Stable MD5 key for a download request"""
+    key_string = f"{kind}:{args!r}"
+    return hashlib.md5(key_string.encode()).hexdigest()
+
+def _cache_path(cache_key):
+    return os.path.join(CACHE_DIR, f"{cache_key}.pkl")
+
+def get_cached_frame(cache_key, max_age=None):
+    """Return a cached DataFrame younger than max_age (default: the TTL), or None"""
+    if max_age is None:
+        max_age = CACHE_TTL_SECONDS
+    path = _cache_path(cache_key)
+    try:
+        if time.time() - os.path.getmtime(path) > max_age:
+            return None
+        return pd.read_pickle(path)
+    except Exception:
+        return None
+
+def cache_frame(cache_key, frame):
+    """Write a DataFrame to the cache atomically (safe across worker threads)"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = _cache_path(cache_key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        frame.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"  ⚠️  yfinance cache write failed: {e}")
+
+def history(symbol, start, end, interval="1d"):
+    """Cached yf.Ticker(symbol).history(start=..., end=...)"""
+    # Keyed on dates so same-day reruns hit even though callers pass datetime.now()
+    cache_key = generate_cache_key("history", symbol, start.date(), end.date(), interval)
+    hist = get_cached_frame(cache_key)
+    if hist is None:
+        hist = yf.Ticker(symbol).history(start=start, end=end, interval=interval)
+        if not hist.empty:
+            cache_frame(cache_key, hist)
+    return hist
+
+def download(tickers, start, end, max_age=None, **kwargs):
+    """Cached yf.download(tickers=..., start=..., end=..., **kwargs)"""
+    cache_key = generate_cache_key("download", tuple(tickers), start.date(), end.date(), sorted(kwargs.items()))
+    data = get_cached_frame(cache_key, max_age)
+    if data is None:
+        data = yf.download(tickers=tickers, start=start, end=end, **kwargs)
+        if not data.empty:
+            cache_frame(cache_key, data)
+    return data
+
+def download_history(tickers, start, end, max_age=None):
+    """Cached batched daily history, split into {ticker: frame}"""
+    # auto_adjust matches Ticker.history(); keeping timezones preserves the
+    # stored timestamps. Tickers share one index, so drop their padding rows.
+    data = download(
+        tickers, start, end, max_age=max_age, interval="1d",
+        group_by='ticker', auto_adjust=True, ignore_tz=False, threads=True, progress=False
+    )
+    downloaded = set(data.columns.get_level_values(0))
+    return {ticker: data[ticker].dropna(how='all') for ticker in tickers if ticker in downloaded}
+
+def download_recent(tickers, days, max_age=None):
+    """Cached batched daily history for the last `days` days, split into {ticker: frame}"""
+    end = datetime.now()
+    return download_history(tickers, end - timedelta(days=days), end, max_age=max_age)